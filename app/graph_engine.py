@@ -1,7 +1,10 @@
 # app/graph_engine.py
-from typing import Dict, Any, Callable, Optional, List
+from typing import Dict, Any, Callable, Optional, List, Tuple, Union
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
 from enum import Enum
-from pydantic import BaseModel
+import asyncio
+import sys
 import uuid
 
 
@@ -12,7 +15,13 @@ class RunStatus(str, Enum):
     FAILED = "FAILED"
 
 
-class NodeConfig(BaseModel):
+# Engine-side config types are plain slotted dataclasses: they are built once
+# and read on every step, so attribute access should be as cheap as possible.
+# Wire-format validation happens at the API boundary (see models.py).
+
+
+@dataclass(slots=True, frozen=True)
+class NodeConfig:
     """
     Configuration for a node in the graph.
     Each node simply points to a tool name in the registry.
@@ -20,7 +29,33 @@ class NodeConfig(BaseModel):
     tool: str
 
 
-class EdgeConfig(BaseModel):
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+def _build_predicate(key: str, gte: Optional[float], lt: Optional[float]) -> Optional[Predicate]:
+    """
+    Build the routing test for a conditional edge, using only the bounds
+    that are actually set. Returns None when there is nothing to test.
+    """
+    if gte is not None and lt is not None:
+        def predicate(state: Dict[str, Any]) -> bool:
+            val = state.get(key)
+            return val is not None and gte <= val < lt
+    elif gte is not None:
+        def predicate(state: Dict[str, Any]) -> bool:
+            val = state.get(key)
+            return val is not None and val >= gte
+    elif lt is not None:
+        def predicate(state: Dict[str, Any]) -> bool:
+            val = state.get(key)
+            return val is not None and val < lt
+    else:
+        return None
+    return predicate
+
+
+@dataclass(slots=True, frozen=True)
+class EdgeConfig:
     """
     Edge configuration for routing from one node to the next.
     - next: default next node
@@ -33,32 +68,92 @@ class EdgeConfig(BaseModel):
     if_true: Optional[str] = None
     if_false: Optional[str] = None
 
+    # Precomputed once so routing never re-checks which fields are set.
+    _has_condition: bool = field(init=False, repr=False, compare=False)
+    _predicate: Optional[Predicate] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_has_condition", bool(self.condition_key))
+        object.__setattr__(
+            self,
+            "_predicate",
+            _build_predicate(self.condition_key, self.gte, self.lt) if self._has_condition else None,
+        )
+
 
-class Graph(BaseModel):
+@dataclass(slots=True)
+class Graph:
     id: str
     nodes: Dict[str, NodeConfig]
     edges: Dict[str, EdgeConfig]
     entrypoint: str
 
+    # Node name -> tool callable, resolved once by create_graph.
+    resolved: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = field(default_factory=dict)
 
-class Run(BaseModel):
+    # Opt-in: stop loops that revisit a state (only sound if every tool is a
+    # deterministic function of state; see _compile).
+    detect_fixpoint: bool = False
+
+    # Straight-line runner built by _compile() at creation time.
+    _compiled: Optional[Callable[["Run", int, bool], None]] = field(default=None, repr=False)
+
+
+def public_view(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of a state dict without the tools' internal keys (see
+    ToolRegistry.register_internal_key), for output.
+    """
+    # dict() is a single C-level copy, so this is safe while a worker thread
+    # is still merging deltas into the live state.
+    view = dict(state)
+    for key in tool_registry.internal_keys:
+        view.pop(key, None)
+    return view
+
+
+@dataclass(slots=True)
+class Run:
     id: str
     graph_id: str
+    initial_state: Dict[str, Any]
     state: Dict[str, Any]
-    log: List[Dict[str, Any]]
+    # Regular steps are logged as (step, node, delta) tuples; errors, warnings
+    # and trace snapshots stay as dicts. Use log_as_dicts() for output.
+    log: List[Union[Tuple[int, str, Dict[str, Any]], Dict[str, Any]]]
     status: RunStatus
     current_node: Optional[str] = None
 
+    def log_as_dicts(self) -> List[Dict[str, Any]]:
+        return [
+            {"step": e[0], "node": e[1], "delta": public_view(e[2])} if type(e) is tuple else e
+            for e in self.log
+        ]
+
 
 class ToolRegistry:
     """
     Very simple in-memory registry of Python functions (tools).
     Tool signature: (state: Dict[str, Any]) -> Dict[str, Any]
-    They read+modify the shared state.
+    Tools read the shared state and return a delta that the engine merges
+    into it. They should not mutate state in place: the returned delta is
+    what gets logged and replayed by reconstruct_state_at. Replacing a
+    top-level key in place still runs correctly; mutating a nested value
+    in place (e.g. appending to a list in state) is invisible to the
+    fixed-point check of graphs created with detect_fixpoint=True and may
+    end such a loop early as FAILED.
+    Tools may register internal state keys (scratch data such as caches):
+    they stay in run.state but are left out of final/current state in API
+    responses, log deltas and error entries (trace snapshots keep them).
     """
 
     def __init__(self):
         self._tools: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+        self.internal_keys: List[str] = []
+
+    def register_internal_key(self, key: str):
+        if key not in self.internal_keys:
+            self.internal_keys.append(key)
 
     def register(self, name: str, func: Callable[[Dict[str, Any]], Dict[str, Any]]):
         self._tools[name] = func
@@ -75,30 +170,254 @@ class ToolRegistry:
 tool_registry = ToolRegistry()
 
 
+# Node id meaning "stop". Compiled node-name tables carry a trailing None so
+# that names[_STOP] is None as well.
+_STOP = -1
+
+
+def reconstruct_state_at(run: Run, step: int) -> Dict[str, Any]:
+    """
+    Rebuild the state as it was right after `step`.
+    Delta entries are replayed on top of the run's initial_state; for trace
+    runs the latest "output" snapshot up to `step` is used instead.
+    """
+    state = dict(run.initial_state)
+    for entry in run.log:
+        if type(entry) is tuple:
+            entry_step, _, delta = entry
+            if entry_step > step:
+                break
+            state.update(delta)
+        elif "output" in entry:
+            if entry["step"] > step:
+                break
+            state = dict(entry["output"])
+    return state
+
+
+def _finish(run: "Run", steps: int, max_steps: int) -> None:
+    if steps >= max_steps:
+        run.status = RunStatus.FAILED
+        run.log.append({"warning": "Max steps reached; possible infinite loop"})
+    else:
+        run.status = RunStatus.COMPLETED
+
+
+def _intern(name: Optional[str]) -> Optional[str]:
+    return None if name is None else sys.intern(name)
+
+
+def _intern_edge(edge_cfg: EdgeConfig) -> EdgeConfig:
+    return replace(
+        edge_cfg,
+        next=_intern(edge_cfg.next),
+        if_true=_intern(edge_cfg.if_true),
+        if_false=_intern(edge_cfg.if_false),
+    )
+
+
+def _compile(graph: Graph) -> Callable[[Run, int, bool], None]:
+    """
+    Compile a graph into a single runner closure.
+    Nodes get integer ids and everything the loop needs is laid out in
+    parallel lists indexed by id, so each step is a handful of list loads,
+    a direct tool call and at most one precompiled edge predicate call.
+
+    With graph.detect_fixpoint, the runner also stops loops that cannot make
+    progress: when a loop head (a node that a conditional edge jumps back
+    to) is re-entered with a state equal to the one it last ran with, every
+    following step would repeat, so the run fails early instead of spinning
+    until max_steps. This is only sound when all tools are deterministic
+    functions of state; tools doing I/O, retries or polling must leave it off.
+
+    Raises KeyError if an edge or the entrypoint names an unknown node.
+    """
+    names: List[Optional[str]] = list(graph.nodes)
+    ids = {name: i for i, name in enumerate(names)}
+    names.append(None)  # names[_STOP]
+
+    def node_id(name: Optional[str]) -> int:
+        if name is None:
+            return _STOP
+        if name not in ids:
+            raise KeyError(f"Node '{name}' not found in graph")
+        return ids[name]
+
+    n = len(ids)
+    tools = [graph.resolved[name] for name in names[:n]]
+    default_next = [_STOP] * n
+    preds: List[Optional[Predicate]] = [None] * n
+    if_true = [_STOP] * n
+    if_false = [_STOP] * n
+
+    for name, edge_cfg in graph.edges.items():
+        i = node_id(name)
+        default_next[i] = node_id(edge_cfg.next)
+        if not edge_cfg._has_condition:
+            continue
+        if_true[i] = node_id(edge_cfg.if_true or edge_cfg.next)
+        if edge_cfg._predicate is None:
+            # A condition_key without bounds is always met.
+            default_next[i] = if_true[i]
+            continue
+        preds[i] = edge_cfg._predicate
+        if_false[i] = node_id(edge_cfg.if_false or edge_cfg.next)
+
+    entry = node_id(graph.entrypoint)
+
+    def successors(i: int) -> List[int]:
+        return [j for j in (default_next[i], if_true[i], if_false[i]) if j != _STOP]
+
+    def reaches(src: int, dst: int) -> bool:
+        stack, visited = [src], set()
+        while stack:
+            i = stack.pop()
+            if i == dst:
+                return True
+            if i not in visited:
+                visited.add(i)
+                stack.extend(successors(i))
+        return False
+
+    # Targets of conditional back-edges: the only places the fixed-point
+    # check runs (none unless the graph opted in).
+    loop_head = [False] * n
+    for i in range(n):
+        if graph.detect_fixpoint and preds[i] is not None:
+            for t in (if_true[i], if_false[i]):
+                if t != _STOP and reaches(t, i):
+                    loop_head[t] = True
+
+    def _run(run: Run, max_steps: int, trace: bool) -> None:
+        state = run.state
+        log = run.log
+        steps = 0
+        cur = entry
+
+        # Shallow state snapshot taken the last time each loop head ran.
+        snapshots: List[Optional[Dict[str, Any]]] = [None] * n
+
+        while cur != _STOP and steps < max_steps:
+            if loop_head[cur]:
+                snapshot = snapshots[cur]
+                try:
+                    same = snapshot is not None and snapshot == state
+                except Exception:
+                    same = False  # values that cannot be compared: skip the check
+                if same:
+                    run.status = RunStatus.FAILED
+                    log.append({"warning": f"Fixed point reached at node '{names[cur]}'; loop cannot make progress"})
+                    return
+                snapshots[cur] = state.copy()
+
+            if trace:
+                before_state = state.copy()
+            try:
+                result = tools[cur](state)
+            except Exception as e:
+                run.status = RunStatus.FAILED
+                log.append({"step": steps, "node": names[cur], "error": str(e), "state": public_view(state)})
+                return
+
+            if result is not None:
+                state.update(result)
+
+            if trace:
+                log.append({"step": steps, "node": names[cur], "input": before_state, "output": state.copy()})
+            else:
+                log.append((steps, names[cur], result or {}))
+
+            pred = preds[cur]
+            if pred is None:
+                cur = default_next[cur]
+            else:
+                cur = if_true[cur] if pred(state) else if_false[cur]
+
+            run.current_node = names[cur]
+            steps += 1
+
+        _finish(run, steps, max_steps)
+
+    return _run
+
+
+class LRUStore(OrderedDict):
+    """
+    Dict bounded to maxsize entries; the least recently used one is evicted.
+    Reads through [] and writes both count as a use.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 class GraphEngine:
     """
     Minimal workflow / graph engine:
-    - Keeps graphs in memory
-    - Keeps runs in memory
+    - Keeps graphs in memory (bounded LRU, plus pinned graphs that never expire)
+    - Keeps runs in memory (bounded LRU)
     - Executes nodes in sequence with simple conditionals + loop support
     """
 
-    def __init__(self):
-        self.graphs: Dict[str, Graph] = {}
-        self.runs: Dict[str, Run] = {}
+    def __init__(self, max_graphs: int = 1_000, max_runs: int = 10_000):
+        self.graphs: Dict[str, Graph] = LRUStore(max_graphs)
+        self.pinned_graphs: Dict[str, Graph] = {}
+        self.runs: Dict[str, Run] = LRUStore(max_runs)
 
     def create_graph(
         self,
         nodes: Dict[str, NodeConfig],
         edges: Dict[str, EdgeConfig],
         entrypoint: str,
+        pinned: bool = False,
+        detect_fixpoint: bool = False,
     ) -> Graph:
+        """
+        Build and compile a graph. Pinned graphs (e.g. the built-in default
+        graph) are kept outside the LRU and are never evicted.
+        detect_fixpoint enables early failure of loops that revisit a state;
+        only use it when every tool is deterministic (see _compile).
+        """
+        # Intern node names so every reference to a node shares one string
+        # object and compares by identity.
+        nodes = {sys.intern(name): cfg for name, cfg in nodes.items()}
+        edges = {sys.intern(name): _intern_edge(cfg) for name, cfg in edges.items()}
+        entrypoint = sys.intern(entrypoint)
+
+        # Resolve tools up front so unknown tool names fail here, not mid-run.
+        resolved = {name: tool_registry.get(cfg.tool) for name, cfg in nodes.items()}
+
         graph_id = str(uuid.uuid4())
-        graph = Graph(id=graph_id, nodes=nodes, edges=edges, entrypoint=entrypoint)
-        self.graphs[graph_id] = graph
+        graph = Graph(
+            id=graph_id,
+            nodes=nodes,
+            edges=edges,
+            entrypoint=entrypoint,
+            resolved=resolved,
+            detect_fixpoint=detect_fixpoint,
+        )
+        graph._compiled = _compile(graph)
+        if pinned:
+            self.pinned_graphs[graph_id] = graph
+        else:
+            self.graphs[graph_id] = graph
         return graph
 
     def get_graph(self, graph_id: str) -> Graph:
+        if graph_id in self.pinned_graphs:
+            return self.pinned_graphs[graph_id]
         if graph_id not in self.graphs:
             raise KeyError(f"Graph '{graph_id}' not found")
         return self.graphs[graph_id]
@@ -113,6 +432,7 @@ class GraphEngine:
         graph_id: str,
         initial_state: Dict[str, Any],
         max_steps: int = 50,
+        trace: bool = False,
     ) -> Run:
         """
         Execute the graph from its entrypoint using initial_state.
@@ -120,6 +440,11 @@ class GraphEngine:
         - sequential transitions via edges
         - conditional routing using EdgeConfig.condition_key, gte, lt, if_true, if_false
         - simple looping by pointing edges back to previous nodes
+        Uses the runner compiled at creation time, executed in a worker
+        thread so a long run does not block the event loop.
+        Each log entry records the delta returned by the node's tool (which
+        keys a tool read is not tracked: tools receive the plain state dict);
+        pass trace=True to log full before/after state snapshots instead.
         """
         graph = self.get_graph(graph_id)
 
@@ -127,6 +452,7 @@ class GraphEngine:
         run = Run(
             id=run_id,
             graph_id=graph_id,
+            initial_state=initial_state.copy(),
             state=initial_state.copy(),
             log=[],
             status=RunStatus.PENDING,
@@ -135,74 +461,7 @@ class GraphEngine:
         self.runs[run_id] = run
         run.status = RunStatus.RUNNING
 
-        steps = 0
-        current = graph.entrypoint
-
-        while current is not None and steps < max_steps:
-            node_cfg = graph.nodes[current]
-            tool = tool_registry.get(node_cfg.tool)
-
-            before_state = run.state.copy()
-            try:
-                result = tool(run.state)  # may modify state in-place and/or return updates
-            except Exception as e:
-                run.status = RunStatus.FAILED
-                run.log.append(
-                    {
-                        "step": steps,
-                        "node": current,
-                        "error": str(e),
-                        "state": run.state.copy(),
-                    }
-                )
-                return run
-
-            if result is not None:
-                run.state.update(result)
-
-            run.log.append(
-                {
-                    "step": steps,
-                    "node": current,
-                    "input": before_state,
-                    "output": run.state.copy(),
-                }
-            )
-
-            edge_cfg = graph.edges.get(current)
-            if not edge_cfg:
-                # No outgoing edge: stop.
-                current = None
-            else:
-                # Default next
-                next_node = edge_cfg.next
-
-                # Optional conditional routing
-                if edge_cfg.condition_key:
-                    val = run.state.get(edge_cfg.condition_key)
-                    condition_met = True
-
-                    if edge_cfg.gte is not None:
-                        condition_met = condition_met and (val is not None and val >= edge_cfg.gte)
-
-                    if edge_cfg.lt is not None:
-                        condition_met = condition_met and (val is not None and val < edge_cfg.lt)
-
-                    if condition_met:
-                        next_node = edge_cfg.if_true or next_node
-                    else:
-                        next_node = edge_cfg.if_false or next_node
-
-                current = next_node
-
-            run.current_node = current
-            steps += 1
-
-        if steps >= max_steps:
-            run.status = RunStatus.FAILED
-            run.log.append({"warning": "Max steps reached; possible infinite loop"})
-        else:
-            run.status = RunStatus.COMPLETED
+        await asyncio.to_thread(graph._compiled, run, max_steps, trace)
 
         return run
 
@@ -1,19 +1,31 @@
 # app/main.py
+import asyncio
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from .graph_engine import engine
+from .graph_engine import engine, public_view
 from .models import (
     GraphCreateRequest,
     GraphCreateResponse,
     GraphRunRequest,
     GraphRunResponse,
+    GraphRunBatchRequest,
+    GraphRunBatchResponse,
     GraphStateResponse,
 )
 from .tools import DEFAULT_CODE_REVIEW_GRAPH_ID  # ensures tools + default graph are registered
 
 
-app = FastAPI(title="Tredence Mini LangGraph Engine", version="0.1.0")
+# Run endpoints return ORJSONResponse objects directly, which FastAPI sends
+# as-is: no response-model validation and no jsonable_encoder walk over the
+# log. Their response models are only referenced for the OpenAPI docs.
+app = FastAPI(
+    title="Tredence Mini LangGraph Engine",
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
+)
 
 # Enable CORS if you later plug a frontend
 app.add_middleware(
@@ -34,34 +46,77 @@ async def root():
 
 @app.post("/graph/create", response_model=GraphCreateResponse)
 async def create_graph(payload: GraphCreateRequest):
-    graph = engine.create_graph(
-        nodes=payload.nodes, edges=payload.edges, entrypoint=payload.entrypoint
-    )
+    nodes = {name: spec.to_config() for name, spec in payload.nodes.items()}
+    edges = {name: spec.to_config() for name, spec in payload.edges.items()}
+    try:
+        graph = engine.create_graph(
+            nodes=nodes,
+            edges=edges,
+            entrypoint=payload.entrypoint,
+            detect_fixpoint=payload.detect_fixpoint,
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
     return GraphCreateResponse(graph_id=graph.id)
 
 
-@app.post("/graph/run", response_model=GraphRunResponse)
+@app.post("/graph/run", responses={200: {"model": GraphRunResponse}})
 async def run_graph(req: GraphRunRequest):
     try:
         _ = engine.get_graph(req.graph_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Graph not found")
 
-    run = await engine.run_graph(req.graph_id, req.initial_state)
-    return GraphRunResponse(run_id=run.id, final_state=run.state, log=run.log)
+    run = await engine.run_graph(req.graph_id, req.initial_state, trace=req.trace)
+    return ORJSONResponse({"run_id": run.id, "final_state": public_view(run.state), "log": run.log_as_dicts()})
+
 
+@app.post("/graph/run_batch", responses={200: {"model": GraphRunBatchResponse}})
+async def run_graph_batch(req: GraphRunBatchRequest):
+    try:
+        _ = engine.get_graph(req.graph_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Graph not found")
 
-@app.get("/graph/state/{run_id}", response_model=GraphStateResponse)
+    sem = asyncio.Semaphore(req.max_concurrency)
+
+    async def run_one(initial_state):
+        async with sem:
+            return await engine.run_graph(req.graph_id, initial_state, trace=req.trace)
+
+    runs = await asyncio.gather(*(run_one(s) for s in req.initial_states))
+    return ORJSONResponse(
+        {
+            "runs": [
+                {"run_id": run.id, "final_state": public_view(run.state), "log": run.log_as_dicts()}
+                for run in runs
+            ]
+        }
+    )
+
+
+@app.get("/graph/state/{run_id}", responses={200: {"model": GraphStateResponse}})
 async def get_graph_state(run_id: str):
     try:
         run = engine.get_run(run_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Run not found")
 
-    return GraphStateResponse(
-        run_id=run.id,
-        graph_id=run.graph_id,
-        state=run.state,
-        status=run.status.value,
-        current_node=run.current_node,
+    return ORJSONResponse(
+        {
+            "run_id": run.id,
+            "graph_id": run.graph_id,
+            # public_view takes a one-shot C-level copy before filtering, so it
+            # is safe while the run is still updating its state in a worker thread.
+            "state": public_view(run.state),
+            "status": run.status.value,
+            "current_node": run.current_node,
+        }
     )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Per-request access logging writes to stderr synchronously; keep it off.
+    uvicorn.run(app, access_log=False)
@@ -1,13 +1,42 @@
 # app/models.py
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, Field
 from .graph_engine import NodeConfig, EdgeConfig
 
 
+class NodeSpec(BaseModel):
+    """Wire format of a node; converted to graph_engine.NodeConfig."""
+    tool: str
+
+    def to_config(self) -> NodeConfig:
+        return NodeConfig(tool=self.tool)
+
+
+class EdgeSpec(BaseModel):
+    """Wire format of an edge; converted to graph_engine.EdgeConfig."""
+    next: Optional[str] = None
+    condition_key: Optional[str] = None
+    gte: Optional[float] = None
+    lt: Optional[float] = None
+    if_true: Optional[str] = None
+    if_false: Optional[str] = None
+
+    def to_config(self) -> EdgeConfig:
+        return EdgeConfig(
+            next=self.next,
+            condition_key=self.condition_key,
+            gte=self.gte,
+            lt=self.lt,
+            if_true=self.if_true,
+            if_false=self.if_false,
+        )
+
+
 class GraphCreateRequest(BaseModel):
-    nodes: Dict[str, NodeConfig]
-    edges: Dict[str, EdgeConfig]
+    nodes: Dict[str, NodeSpec]
+    edges: Dict[str, EdgeSpec]
     entrypoint: str
+    detect_fixpoint: bool = False  # only for graphs whose tools are deterministic
 
 
 class GraphCreateResponse(BaseModel):
@@ -17,6 +46,7 @@ class GraphCreateResponse(BaseModel):
 class GraphRunRequest(BaseModel):
     graph_id: str
     initial_state: Dict[str, Any] = {}
+    trace: bool = False  # log full before/after state per step instead of deltas
 
 
 class GraphRunResponse(BaseModel):
@@ -25,6 +55,17 @@ class GraphRunResponse(BaseModel):
     log: List[Dict[str, Any]]
 
 
+class GraphRunBatchRequest(BaseModel):
+    graph_id: str
+    initial_states: List[Dict[str, Any]]
+    max_concurrency: int = Field(10, ge=1)  # runs executing at the same time
+    trace: bool = False
+
+
+class GraphRunBatchResponse(BaseModel):
+    runs: List[GraphRunResponse]
+
+
 class GraphStateResponse(BaseModel):
     run_id: str
     graph_id: str
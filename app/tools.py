@@ -1,33 +1,111 @@
 # app/tools.py
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List
+import re
+
 from .graph_engine import tool_registry, NodeConfig, EdgeConfig, engine
 
+try:
+    import ahocorasick  # optional: pyahocorasick, single-pass multi-pattern scan
+except ImportError:
+    ahocorasick = None
+
+try:
+    from numba import njit  # optional: JIT for numeric kernels
+except ImportError:
+    njit = None
+
+
+def cond_jit(**kwargs):
+    """
+    numba.njit(**kwargs) when numba is installed, otherwise a no-op decorator.
+    """
+    if njit is None:
+        return lambda func: func
+    return njit(**kwargs)
+
+
+# Matches 'def <name>(' and captures the name.
+_DEF_RE = re.compile(r"\bdef\s+([A-Za-z_]\w*)\s*\(")
+
+# Substring -> issue message, in reporting order.
+_ISSUE_PATTERNS = {
+    "TODO": "Unresolved TODO comment found.",
+    "print(": "Debug print statement found.",
+}
+
+_ISSUE_AUTOMATON = None
+if ahocorasick is not None:
+    _ISSUE_AUTOMATON = ahocorasick.Automaton()
+    for _pattern in _ISSUE_PATTERNS:
+        _ISSUE_AUTOMATON.add_word(_pattern, _pattern)
+    _ISSUE_AUTOMATON.make_automaton()
+
+
+def _find_functions(code: str) -> List[str]:
+    return _DEF_RE.findall(code)
+
+
+def _find_issues(code: str) -> List[str]:
+    """
+    Issue patterns present in the source, in _ISSUE_PATTERNS order.
+    """
+    if _ISSUE_AUTOMATON is not None:
+        found = {pattern for _, pattern in _ISSUE_AUTOMATON.iter(code)}
+    else:
+        found = {pattern for pattern in _ISSUE_PATTERNS if pattern in code}
+    return [pattern for pattern in _ISSUE_PATTERNS if pattern in found]
+
+
+def _scan_code(code: str) -> Dict[str, Any]:
+    """
+    Scan the source once for everything the review tools need:
+    - "code": the scanned source object, to detect a stale scan
+    - "functions": see _find_functions
+    - "found": see _find_issues
+    """
+    return {"code": code, "functions": _find_functions(code), "found": _find_issues(code)}
+
+
+def _scanned(state: Dict[str, Any], key: str, compute: Callable[[str], List[str]]) -> List[str]:
+    # Reuse the prepared scan only if it was taken of this exact code object;
+    # otherwise (no "prepare" node, stale or client-supplied _scan) compute
+    # just the part the calling tool needs.
+    code = state.get("code", "")
+    scan = state.get("_scan")
+    if isinstance(scan, dict) and scan.get("code") is code and key in scan:
+        return scan[key]
+    return compute(code)
+
 
 # ---------- Tool implementations ----------
 
-def extract_functions_tool(state: Dict[str, Any]) -> Dict[str, Any]:
+def prepare_code_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Very naive function extractor: looks for 'def <name>(' patterns.
+    Scans the source once and shares the result with later tools.
     Input: state["code"] : str
-    Output: state["functions"] : List[str]
+    Output: state["_scan"] : Dict[str, Any] (see _scan_code)
+    _scan is registered as an internal key, so it is left out of API
+    responses (see graph_engine.public_view).
     """
-    code = state.get("code", "")
-    functions: List[str] = []
+    return {"_scan": _scan_code(state.get("code", ""))}
 
-    for part in code.split("def "):
-        if not part.strip():
-            continue
-        header = part.split("(", 1)[0]
-        name = header.strip()
-        if name:
-            functions.append(name)
 
-    return {"functions": functions}
+def extract_functions_tool(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Very naive function extractor: looks for 'def <name>(' patterns.
+    Also computes the complexity score (see check_complexity_tool), saving
+    a separate graph step.
+    Input: state["code"] : str (or state["_scan"] if already prepared)
+    Output: state["functions"] : List[str], state["complexity_score"] : float
+    """
+    functions: List[str] = _scanned(state, "functions", _find_functions)
+    return {"functions": functions, "complexity_score": float(len(functions))}
 
 
 def check_complexity_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Toy complexity metric based on number of functions.
+    extract_functions_tool already produces it; kept for custom graphs.
     Output: state["complexity_score"] : float
     """
     functions: List[str] = state.get("functions", [])
@@ -41,14 +119,7 @@ def detect_issues_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     - Flags TODO comments
     - Flags print() usage as 'debug prints'
     """
-    code = state.get("code", "")
-    issues: List[str] = []
-
-    if "TODO" in code:
-        issues.append("Unresolved TODO comment found.")
-    if "print(" in code:
-        issues.append("Debug print statement found.")
-
+    issues: List[str] = [_ISSUE_PATTERNS[pattern] for pattern in _scanned(state, "found", _find_issues)]
     return {"issues": issues, "issue_count": len(issues)}
 
 
@@ -70,21 +141,27 @@ def suggest_improvements_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     return {"suggestions": suggestions}
 
 
+@cond_jit(cache=True)
+def _quality_kernel(issue_count: float, complexity: float) -> float:
+    raw_penalty = issue_count + complexity / 10.0
+    return max(0.0, 1.0 - min(raw_penalty / 10.0, 1.0))
+
+
 def evaluate_quality_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Produces a synthetic quality_score in [0, 1].
     Lower issues + lower complexity => higher quality.
     """
-    issue_count = state.get("issue_count", 0)
-    complexity = state.get("complexity_score", 0.0)
+    issue_count = float(state.get("issue_count", 0))
+    complexity = float(state.get("complexity_score", 0.0))
 
-    raw_penalty = issue_count + complexity / 10.0
-    quality = max(0.0, 1.0 - min(raw_penalty / 10.0, 1.0))
-    state["quality_score"] = quality  # also store in-place
+    quality = _quality_kernel(issue_count, complexity)
     return {"quality_score": quality}
 
 
 # Register tools in the global registry
+tool_registry.register("prepare_code", prepare_code_tool)
+tool_registry.register_internal_key("_scan")
 tool_registry.register("extract_functions", extract_functions_tool)
 tool_registry.register("check_complexity", check_complexity_tool)
 tool_registry.register("detect_issues", detect_issues_tool)
@@ -97,24 +174,24 @@ tool_registry.register("evaluate_quality", evaluate_quality_tool)
 def create_default_code_review_graph() -> str:
     """
     Creates a sample graph for:
-    1. Extract functions
-    2. Check complexity
+    1. Scan the source once (shared by steps 2 and 3)
+    2. Extract functions and check complexity
     3. Detect basic issues
     4. Suggest improvements
     5. Loop until quality_score >= threshold
     Returns: graph_id
     """
     nodes = {
+        "prepare": NodeConfig(tool="prepare_code"),
         "extract": NodeConfig(tool="extract_functions"),
-        "complexity": NodeConfig(tool="check_complexity"),
         "issues": NodeConfig(tool="detect_issues"),
         "improve": NodeConfig(tool="suggest_improvements"),
         "score": NodeConfig(tool="evaluate_quality"),
     }
 
     edges = {
-        "extract": EdgeConfig(next="complexity"),
-        "complexity": EdgeConfig(next="issues"),
+        "prepare": EdgeConfig(next="extract"),
+        "extract": EdgeConfig(next="issues"),
         "issues": EdgeConfig(next="improve"),
         "improve": EdgeConfig(next="score"),
         # Loop: if quality_score < 0.8, go back to "improve"
@@ -126,7 +203,11 @@ def create_default_code_review_graph() -> str:
         ),
     }
 
-    graph = engine.create_graph(nodes=nodes, edges=edges, entrypoint="extract")
+    # Every tool here is a pure function of state, so a non-converging loop
+    # can be cut short instead of running to max_steps.
+    graph = engine.create_graph(
+        nodes=nodes, edges=edges, entrypoint="prepare", pinned=True, detect_fixpoint=True
+    )
     return graph.id
 
 